@@ -1,46 +1,136 @@
-from fastapi import FastAPI, Request, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime
+
+from fastapi import BackgroundTasks, FastAPI, Request, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import List, Optional
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from pydantic import BaseModel, ConfigDict, Field
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, List, Optional, Tuple
 
 from app.schemas import ExtractionResult, RuleAlert
-from app.services.extractor import extract_structured
+from app.services.extractor import close_client, extract_structured
 from app.services.rules_engine import run_rules
-from app.services.deid import deidentify_pdf, DeidentificationError
+from app.services.deid import deidentify_pdf, DeidentificationError, warm_up as warm_up_pdf
+
+logger = logging.getLogger(__name__)
 
 
 app = FastAPI(
     title="CardioCoach API",
     description="Backend for structured NHS discharge extraction + clinical rules",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 # Serve static CSS + assets
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+STATIC_DIR = "app/static"
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with explicit Cache-Control. URLs carrying a content version
+    (?v=..., see static_url) never change and are cached for a year;
+    unversioned URLs revalidate via the ETag StaticFiles already sends.
+    """
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            if scope.get("query_string", b"").startswith(b"v="):
+                response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+            else:
+                response.headers["Cache-Control"] = "no-cache"
+        return response
+
+
+@lru_cache(maxsize=None)
+def static_url(filename: str) -> str:
+    """URL for a static asset, fingerprinted with a hash of its contents."""
+    with open(os.path.join(STATIC_DIR, filename), "rb") as f:
+        digest = hashlib.blake2b(f.read(), digest_size=4).hexdigest()
+    return f"/static/{filename}?v={digest}"
+
+
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR, html=False), name="static")
+
+# Jinja2 templates — templates only change on deploy, so skip the per-render
+# mtime check and keep compiled bytecode on disk across worker restarts.
+_JINJA_CACHE_DIR = os.path.join(tempfile.gettempdir(), "cardiocoach-jinja")
+os.makedirs(_JINJA_CACHE_DIR, exist_ok=True)
 
-# Jinja2 templates
-templates = Jinja2Templates(directory="app/templates")
+templates = Jinja2Templates(
+    env=Environment(
+        loader=FileSystemLoader("app/templates"),
+        autoescape=True,
+        auto_reload=False,
+        bytecode_cache=FileSystemBytecodeCache(_JINJA_CACHE_DIR),
+    )
+)
+templates.env.globals["static_url"] = static_url
 
 
 # ----------------------------------------------------------
 # FRONTEND: Patient UI
 # ----------------------------------------------------------
+# index.html has no per-request context, so it is rendered once at startup,
+# alongside a gzip-compressed copy for clients that accept it
+_INDEX_HTML: bytes = b""
+_INDEX_HTML_GZIP: bytes = b""
+
+
+@app.on_event("startup")
+async def _prerender_index() -> None:
+    global _INDEX_HTML, _INDEX_HTML_GZIP
+    _INDEX_HTML = templates.get_template("index.html").render().encode("utf-8")
+    _INDEX_HTML_GZIP = gzip.compress(_INDEX_HTML, compresslevel=9, mtime=0)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """True unless gzip is absent from Accept-Encoding or refused with q=0."""
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "gzip":
+            q = params.replace(" ", "").lower()
+            return q not in ("q=0", "q=0.", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Serve the patient-facing UI."""
-    return templates.TemplateResponse(request=request, name="index.html")
+    headers = {"Vary": "Accept-Encoding"}
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        return HTMLResponse(content=_INDEX_HTML_GZIP, headers=headers)
+    return HTMLResponse(content=_INDEX_HTML, headers=headers)
 
 
 # ----------------------------------------------------------
 # API MODELS
 # ----------------------------------------------------------
+# Far above any real discharge letter; bounds worst-case extraction cost
+MAX_TEXT_CHARS = 200_000
+
+
 class ProcessRequest(BaseModel):
-    text: str
+    text: str = Field(..., min_length=1, max_length=MAX_TEXT_CHARS)
 
 
 class ProcessResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     extraction: ExtractionResult
     alerts: List[RuleAlert]
     explanation: Optional[str] = None
@@ -48,55 +138,251 @@ class ProcessResponse(BaseModel):
 
 
 # ----------------------------------------------------------
-# HEALTHCHECK
+# UPLOAD LIMITS
 # ----------------------------------------------------------
-@app.get("/health")
-def health_check():
-    return {"status": "ok"}
+MAX_PDF_BYTES = 20_000_000
+MAX_JSON_BYTES = 1_000_000
+UPLOAD_CHUNK_BYTES = 64 * 1024
+PDF_MAGIC = b"%PDF-"
+
+# Request body ceilings per route
+_MAX_BODY_BYTES = {
+    "/process": MAX_JSON_BYTES,
+    "/process-pdf": MAX_PDF_BYTES,
+}
+
+
+def _body_too_large(limit: int) -> str:
+    return f"Request body exceeds the {limit} byte limit."
+
+
+class BodyLimitMiddleware:
+    """
+    Reject oversized requests before FastAPI parses the body. A declared
+    Content-Length over the limit is refused without reading anything;
+    otherwise (e.g. chunked uploads) bytes are counted as they stream in
+    and the request is cut off as soon as the count passes the limit.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = _MAX_BODY_BYTES.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(status_code=413, content={"detail": _body_too_large(limit)})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside body parsing: FastAPI re-raises
+                    # HTTPException untouched, so the client gets a 413
+                    raise HTTPException(status_code=413, detail=_body_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(BodyLimitMiddleware)
 
 
 # ----------------------------------------------------------
-# MAIN PROCESSING ROUTES
+# PIPELINE CACHE
 # ----------------------------------------------------------
-@app.post("/process", response_model=ProcessResponse)
-async def process_discharge_letter(payload: ProcessRequest):
+# Repeat submissions of the same letter (UI retries, PDF re-uploads) skip
+# the LLM extraction. Only the extraction is cached: the rules depend on
+# today's date (stale follow-up dates) and cost microseconds, so they re-run
+# on every hit. Keys are blake2b digests of the text; values are plain dicts
+# so cached state cannot be mutated through the returned models. Entries
+# carry the de-identified letter (raw_text, up to MAX_TEXT_CHARS), so the
+# cache is bounded by total letter size as well as by entry count.
+PIPELINE_CACHE_SIZE = 512
+PIPELINE_CACHE_MAX_CHARS = 10_000_000
+
+_pipeline_cache: "OrderedDict[str, Tuple[Dict, int]]" = OrderedDict()
+_pipeline_cache_chars = 0
+_pipeline_cache_lock = threading.Lock()
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def _cached_extraction(text: str) -> ExtractionResult:
+    """Run extraction, reusing the result for identical text."""
+    global _pipeline_cache_chars
+    key = _text_hash(text)
+
+    with _pipeline_cache_lock:
+        cached = _pipeline_cache.get(key)
+        if cached is not None:
+            _pipeline_cache.move_to_end(key)
+
+    if cached is not None:
+        return ExtractionResult.model_validate(cached[0])
+
+    extraction = await extract_structured(text)
+    size = len(extraction.raw_text or "")
+    with _pipeline_cache_lock:
+        # A concurrent request for the same letter may have stored it first
+        previous = _pipeline_cache.pop(key, None)
+        if previous is not None:
+            _pipeline_cache_chars -= previous[1]
+        _pipeline_cache[key] = (extraction.model_dump(), size)
+        _pipeline_cache_chars += size
+        while (
+            len(_pipeline_cache) > PIPELINE_CACHE_SIZE
+            or _pipeline_cache_chars > PIPELINE_CACHE_MAX_CHARS
+        ):
+            _, (_, evicted_size) = _pipeline_cache.popitem(last=False)
+            _pipeline_cache_chars -= evicted_size
+    return extraction
+
+
+async def _run_pipeline(text: str, background: BackgroundTasks) -> ProcessResponse:
     """
-    Process a plain-text discharge letter pasted into the UI.
+    Shared extraction + rules pipeline behind /process and /process-pdf.
+
+    Extraction awaits the async OpenAI client and the CPU-bound rules
+    engine runs in the threadpool, so a slow letter does not stall other
+    requests. Non-critical post-processing is queued on `background` and
+    runs after the response has been sent.
     """
-    extraction = extract_structured(payload.text)
-    alerts = run_rules(extraction)
+    extraction = await _cached_extraction(text)
+    alerts = await run_in_threadpool(run_rules, extraction)
 
-    return ProcessResponse(
+    response = ProcessResponse(
         extraction=extraction,
         alerts=alerts,
         explanation=extraction.narrative_summary,
         gp_questions=None,
     )
+    background.add_task(_emit_audit, response)
+    return response
+
+
+def _json_response(response: ProcessResponse) -> ORJSONResponse:
+    """
+    Serialise an already-validated response directly. Routes declare the
+    schema via `responses=` instead of `response_model=`, so FastAPI does
+    not validate the payload a second time on the way out.
+    """
+    return ORJSONResponse(response.model_dump(mode="json"))
+
+
+def _emit_audit(response: ProcessResponse) -> None:
+    """Audit log line — counts and alert codes only, no patient data."""
+    logger.info(
+        "pipeline | ts=%s | meds=%d | alerts=%d | codes=%s",
+        datetime.utcnow().isoformat(timespec="seconds"),
+        len(response.extraction.medication_changes),
+        len(response.alerts),
+        ",".join(a.code for a in response.alerts) or "-",
+    )
+
+
+# ----------------------------------------------------------
+# STARTUP / SHUTDOWN
+# ----------------------------------------------------------
+# Every rules-engine pattern is compiled at import; running this extraction
+# only primes the lru_caches of per-name drug classes and per-entry
+# diagnosis / procedure groups with common values
+_WARMUP_EXTRACTION = {
+    "diagnoses": ["atrial fibrillation", "myocardial infarction", "heart failure"],
+    "procedures": ["pci"],
+    "medication_changes": [{"name": "apixaban", "action": "stop"}],
+    "follow_up": [{"type": "cardiology clinic", "when": "01/01/2000"}],
+    "pending_tests": [],
+    "red_flags": [],
+}
+
+
+@app.on_event("startup")
+async def _warm_pipeline() -> None:
+    """Pay PDFium start-up and prime the rules engine before the first request."""
+    await run_in_threadpool(_warm_up)
+
+
+def _warm_up() -> None:
+    warm_up_pdf()
+    run_rules(ExtractionResult.model_validate(_WARMUP_EXTRACTION))
+
 
+@app.on_event("shutdown")
+async def _close_openai_client() -> None:
+    await close_client()
 
-@app.post("/process-pdf", response_model=ProcessResponse)
-async def process_discharge_pdf(file: UploadFile = File(...)):
+
+# ----------------------------------------------------------
+# HEALTHCHECK
+# ----------------------------------------------------------
+# Pre-serialised once: probes hit this far more often than any other route
+_HEALTH_RESPONSE = Response(content=b'{"status":"ok"}', media_type="application/json")
+
+
+@app.get("/health")
+def health_check():
+    return _HEALTH_RESPONSE
+
+
+# ----------------------------------------------------------
+# MAIN PROCESSING ROUTES
+# ----------------------------------------------------------
+@app.post("/process", responses={200: {"model": ProcessResponse}})
+async def process_discharge_letter(payload: ProcessRequest, background: BackgroundTasks):
+    """
+    Process a plain-text discharge letter pasted into the UI.
+    """
+    return _json_response(await _run_pipeline(payload.text, background))
+
+
+@app.post("/process-pdf", responses={200: {"model": ProcessResponse}})
+async def process_discharge_pdf(background: BackgroundTasks, file: UploadFile = File(...)):
     """
     Accept a PDF discharge letter, de-identify it, then run
     the same extraction + rules pipeline as /process.
+
+    PDF parsing is CPU-bound, so it runs in the threadpool to keep the
+    event loop free for other requests.
     """
-    raw_bytes = await file.read()
+    if file.content_type != "application/pdf":
+        logger.debug("uploaded non-pdf content_type=%s", file.content_type)
 
-    try:
-        clean_text = deidentify_pdf(raw_bytes)
-    except DeidentificationError as e:
-        raise HTTPException(status_code=422, detail=str(e))
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read PDF: {e}")
+    # Copy the upload in fixed-size chunks to a temp file that PDFium reads
+    # in place, so memory stays flat regardless of PDF size.
+    with tempfile.TemporaryFile() as spool:
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            if size == 0 and not chunk.startswith(PDF_MAGIC):
+                raise HTTPException(status_code=415, detail="Uploaded file is not a PDF.")
+            size += len(chunk)
+            if size > MAX_PDF_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"PDF exceeds the {MAX_PDF_BYTES} byte limit.",
+                )
+            spool.write(chunk)
+        spool.seek(0)
 
-    extraction = extract_structured(clean_text)
-    alerts = run_rules(extraction)
+        try:
+            clean_text = await run_in_threadpool(deidentify_pdf, spool)
+        except DeidentificationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to read PDF: {e}")
 
-    return ProcessResponse(
-        extraction=extraction,
-        alerts=alerts,
-        explanation=extraction.narrative_summary,
-        gp_questions=None,
-    )
\ No newline at end of file
+    return _json_response(await _run_pipeline(clean_text, background))
\ No newline at end of file
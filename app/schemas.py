@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional, Literal
 
 
@@ -15,6 +15,8 @@ class HelpSeeking(BaseModel):
 
 
 class MedicationChange(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     name: str
     action: Literal["start", "stop", "increase", "decrease", "continue"]
     dose: Optional[str] = None
@@ -32,6 +34,8 @@ class FollowUpItem(BaseModel):
 
 
 class ExtractionResult(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     diagnoses: List[str]
     procedures: List[str]
     medication_changes: List[MedicationChange]
@@ -56,6 +60,8 @@ class ExtractionResult(BaseModel):
 
 
 class RuleAlert(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     code: str
     severity: Literal["info", "warning", "critical"]
     message: str
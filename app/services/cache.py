@@ -0,0 +1,49 @@
+"""
+CardioCoach — LLM Response Cache
+app/services/cache.py
+
+Disk-backed cache for OpenAI completions. Identical de-identified letters
+(UI retries, QA replays, re-uploads of the same PDF) reuse the stored
+completion instead of paying another 2–10 s model round-trip.
+
+The cache lives on local disk and is shared by every uvicorn worker on the
+host. Keys are SHA-256 digests of the model name and full prompt, so a
+prompt or model change never serves a stale completion.
+
+Stored completions are the model's structured extraction of the letter:
+diagnoses, medicines and clinical narrative, written unencrypted for 24 h.
+Prompts only carry text that has passed the basic PHI scrub in
+deidentify_text, which can miss identifiers. The cache is therefore off
+unless CARDIOCOACH_CACHE_DIR names a directory on protected storage.
+"""
+
+import hashlib
+import os
+from typing import Optional
+
+from diskcache import Cache
+
+CACHE_DIR = os.getenv("CARDIOCOACH_CACHE_DIR")
+CACHE_TTL_SECONDS = 86_400
+
+_cache: Optional[Cache] = Cache(CACHE_DIR) if CACHE_DIR else None
+
+
+def completion_key(model: str, *messages: str) -> str:
+    """Stable key for a completion request."""
+    h = hashlib.sha256(model.encode("utf-8"))
+    for message in messages:
+        h.update(b"\0")
+        h.update(message.encode("utf-8"))
+    return h.hexdigest()
+
+
+def get_completion(key: str) -> Optional[str]:
+    if _cache is None:
+        return None
+    return _cache.get(key)
+
+
+def set_completion(key: str, content: str) -> None:
+    if _cache is not None:
+        _cache.set(key, content, expire=CACHE_TTL_SECONDS)
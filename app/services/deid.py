@@ -22,13 +22,20 @@ DeidentificationError if any are detected — no patient data is logged.
 Version: 1.0-pre-lock | March 2026
 """
 
+import io
 import logging
+import multiprocessing
+import os
 import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from io import BytesIO
-from typing import List
+from typing import BinaryIO, Iterator, List, Optional, Union
 
 import pdfplumber
+import pypdfium2 as pdfium
 
 logger = logging.getLogger(__name__)
 
@@ -47,20 +54,6 @@ _DOB_LABEL_RE = re.compile(
     re.IGNORECASE,
 )
 
-# Header block labelled fields — replace entire line including any leading
-# whitespace pdfplumber inserts for layout positioning.
-# No capture groups: replacement strings are hardcoded to avoid backreference
-# failures when the group doesn't match.
-_NAME_LINE_RE = re.compile(
-    r"(?im)^[^\S\r\n]*Name\s*:[^\S\r\n]*.+$"
-)
-_HOSPITAL_NO_RE = re.compile(
-    r"(?im)^[^\S\r\n]*Hospital\s*(?:No|Number|Num)?\s*:[^\S\r\n]*.+$"
-)
-_ADDRESS_LINE_RE = re.compile(
-    r"(?im)^[^\S\r\n]*Address\s*:[^\S\r\n]*.+$"
-)
-
 # Street address pattern in running text (number + street word + optional city)
 _STREET_RE = re.compile(
     r"\b\d{1,4}\s+[A-Z][A-Za-z]+(?:\s+[A-Z][A-Za-z]+){0,4}"
@@ -70,6 +63,69 @@ _STREET_RE = re.compile(
 # Salutation + surname in free-text narrative
 _SALUTATION_RE = re.compile(r"\b(Mr|Mrs|Ms|Miss|Dr)\.?\s+[A-Z][a-zA-Z\-']+\b")
 
+# Step-5 scrub: header block labelled fields (Name / Hospital No / Address,
+# entire line including any leading layout whitespace) and the patterns
+# above, fused into two alternations so the text is walked twice rather
+# than six times. Branch and pass order follow the old substitution order:
+# NHS numbers must be gone before the DOB pattern runs, or its .{0,30}
+# window could swallow the first digits of one and leave the rest behind.
+_LABELLED_LINE_NHS_RE = re.compile(
+    r"(?im:^[^\S\r\n]*(?:(?P<name>Name)"
+    r"|(?P<hospital>Hospital\s*(?:No|Number|Num)?)"
+    r"|(?P<address>Address))\s*:[^\S\r\n]*.+$)"
+    r"|(?P<nhs>\b\d{3}\s\d{3}\s\d{4}\b)"
+)
+# A postcode glued to the end of a DOB date only gained a word boundary
+# once the DOB was replaced, so the DOB branch takes it along.
+_DOB_POSTCODE_RE = re.compile(
+    r"(?P<dob>(?i:\b(?:DOB|D\.O\.B|Date\s+of\s+Birth)\b.{0,30}"
+    r"\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4}))"
+    r"(?P<dob_postcode>[A-Z]{1,2}\d[A-Z0-9]?\s*\d[A-Z]{2}\b)?"
+    r"|(?P<postcode>\b[A-Z]{1,2}\d[A-Z0-9]?\s*\d[A-Z]{2}\b)"
+)
+_STRUCTURED_PHI_SUBS = {
+    "name": "Name: <<PATIENT_NAME>>",
+    "hospital": "Hospital No: <<HOSPITAL_NUMBER>>",
+    "address": "Address: <<ADDRESS>>",
+    "nhs": "<<NHS_NUMBER>>",
+    "dob": "<<DATE_OF_BIRTH>>",
+    "dob_postcode": "<<DATE_OF_BIRTH>><<POSTCODE>>",
+    "postcode": "<<POSTCODE>>",
+}
+
+
+# ── PDF parsing concurrency ───────────────────────────────────────────────────
+
+# PDFium is not thread-safe: in-process parsing is serialised by this lock.
+_PDFIUM_LOCK = threading.Lock()
+
+# Typical NBT letters are four pages and are parsed in-process. PDFium reads
+# a 25-page document in under 10 ms, and spawning the pool costs far more
+# on first use, so only very long documents are split into page ranges and
+# parsed in worker processes, each with its own copy of PDFium. Every
+# uvicorn worker holds its own pool, so the CPUs are shared between them;
+# with one uvicorn worker per CPU the pool is never started.
+_PARALLEL_MIN_PAGES = 200
+_PDF_WORKERS = (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY") or 1))
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
+# Smallest valid one-page PDF, parsed once at startup by warm_up()
+_MIN_PDF_BYTES = (
+    b"%PDF-1.4\n"
+    b"1 0 obj<</Type/Catalog/Pages 2 0 R>> endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>> endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 3 3]>> endobj\n"
+    b"xref\n0 4\n"
+    b"0000000000 65535 f \n"
+    b"0000000009 00000 n \n"
+    b"0000000053 00000 n \n"
+    b"0000000103 00000 n \n"
+    b"trailer<</Size 4/Root 1 0 R>>\nstartxref\n163\n%%EOF\n"
+)
+
 
 # ── Public exception ──────────────────────────────────────────────────────────
 
@@ -83,14 +139,15 @@ class DeidentificationError(Exception):
 
 # ── Main function ─────────────────────────────────────────────────────────────
 
-def deidentify_pdf(pdf_bytes: bytes) -> str:
+def deidentify_pdf(pdf: Union[bytes, BinaryIO]) -> str:
     """
     De-identify a North Bristol discharge letter PDF.
 
     Parameters
     ----------
-    pdf_bytes : bytes
-        Raw bytes of the uploaded PDF file.
+    pdf : bytes or binary file object
+        Raw bytes of the uploaded PDF file, or a seekable binary file
+        holding them (read in place, without loading it into memory).
 
     Returns
     -------
@@ -105,42 +162,60 @@ def deidentify_pdf(pdf_bytes: bytes) -> str:
     DeidentificationError
         If residual PHI patterns are detected after scrubbing.
     """
-    # ── Step 1: Extract text page by page ────────────────────────────────────
-    pages_text: List[str] = _extract_pages(pdf_bytes)
-
-    if not any(p.strip() for p in pages_text):
+    # ── Steps 1–3: Stream pages, strip footer, join ──────────────────────────
+    # Pages are consumed as they are extracted, so no per-page list is held
+    # alongside the joined text through the scrub passes below.
+    page_count = 0
+    chars_before = 0
+    has_text = False
+
+    def _pages(source_pages: Iterator[str]) -> Iterator[str]:
+        nonlocal page_count, chars_before, has_text
+        previous: Optional[str] = None
+        for text in source_pages:
+            page_count += 1
+            has_text = has_text or (bool(text) and not text.isspace())
+            if previous is not None:
+                chars_before += len(previous)
+                yield previous
+            previous = text
+        if previous is not None:
+            # The NBT template footer line contains the NHS number in
+            # XXX XXX XXXX format. Strip any line from the last page that
+            # contains this pattern.
+            last = _strip_nhs_footer_lines(previous)
+            chars_before += len(last)
+            yield last
+
+    full_text = _join_pages(_pages(_iter_pages(pdf)))
+
+    if not has_text:
+        # PDFium found no text layer. pdfminer (via pdfplumber) is far slower
+        # but occasionally recovers text PDFium skips, so try it once.
+        page_count = chars_before = 0
+        full_text = _join_pages(_pages(_iter_pages_pdfplumber(pdf)))
+
+    if not has_text:
         raise ValueError(
             "No readable text found in PDF. "
             "The file may be scanned or image-only — text extraction is not possible."
         )
 
-    # ── Step 2: Strip footer identifier line from last page ───────────────────
-    # The NBT template footer line contains the NHS number in XXX XXX XXXX
-    # format. Strip any line from the last page that contains this pattern.
-    pages_text[-1] = _strip_nhs_footer_lines(pages_text[-1])
-
-    # ── Step 3: Join pages ────────────────────────────────────────────────────
-    full_text = "\n\n".join(pages_text)
-
     # ── Step 4: Scrub salutations in free-text narrative ─────────────────────
     full_text = _SALUTATION_RE.sub("the patient", full_text)
 
     # ── Step 5: Belt-and-braces scrub of any remaining structured PHI ─────────
-    # Labelled header fields — replace entire line with clean placeholder
-    full_text = _NAME_LINE_RE.sub("Name: <<PATIENT_NAME>>", full_text)
-    full_text = _HOSPITAL_NO_RE.sub("Hospital No: <<HOSPITAL_NUMBER>>", full_text)
-    full_text = _ADDRESS_LINE_RE.sub("Address: <<ADDRESS>>", full_text)
-    # NHS numbers, DOB labels, postcodes
-    full_text = _NHS_RE.sub("<<NHS_NUMBER>>", full_text)
-    full_text = _DOB_LABEL_RE.sub("<<DATE_OF_BIRTH>>", full_text)
-    full_text = _POSTCODE_RE.sub("<<POSTCODE>>", full_text)
+    # Labelled header fields (entire line replaced with a clean placeholder)
+    # and NHS numbers in one pass, then DOB labels and postcodes in another
+    full_text = _LABELLED_LINE_NHS_RE.sub(_structured_phi_sub, full_text)
+    full_text = _DOB_POSTCODE_RE.sub(_structured_phi_sub, full_text)
 
     # ── Step 6: Audit log — no patient data written ───────────────────────────
     logger.info(
         "deid | ts=%s | pages=%d | chars_before=%d | chars_after=%d",
         datetime.utcnow().isoformat(timespec="seconds"),
-        len(pages_text),
-        sum(len(p) for p in pages_text),
+        page_count,
+        chars_before,
         len(full_text),
     )
 
@@ -150,16 +225,122 @@ def deidentify_pdf(pdf_bytes: bytes) -> str:
     return full_text.strip()
 
 
+def warm_up() -> None:
+    """
+    Parse a minimal in-memory PDF so PDFium library initialisation is paid
+    at worker startup rather than by the first upload.
+    """
+    for _ in _iter_pages(_MIN_PDF_BYTES):
+        pass
+
+
 # ── Private helpers ───────────────────────────────────────────────────────────
 
-def _extract_pages(pdf_bytes: bytes) -> List[str]:
-    """Open PDF with pdfplumber and return one string per page."""
-    pages: List[str] = []
-    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+def _join_pages(pages: Iterator[str]) -> str:
+    """
+    Join pages with blank lines into one buffer; "\n\n".join() would first
+    collect every page from the generator into an intermediate list.
+    """
+    buf = io.StringIO()
+    for i, text in enumerate(pages):
+        if i:
+            buf.write("\n\n")
+        buf.write(text)
+    return buf.getvalue()
+
+
+def _structured_phi_sub(m: "re.Match[str]") -> str:
+    """Placeholder for whichever step-5 branch matched."""
+    return _STRUCTURED_PHI_SUBS[m.lastgroup]
+
+
+def _iter_pages(source: Union[bytes, BinaryIO]) -> Iterator[str]:
+    """
+    Yield page text in order. Short documents are read in-process, one
+    page at a time; documents longer than _PARALLEL_MIN_PAGES are fanned
+    out across a process pool in contiguous page ranges.
+    """
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            n_pages = len(pdf)
+            if n_pages <= _PARALLEL_MIN_PAGES or _PDF_WORKERS < 2:
+                yield from _iter_page_text(pdf, 0, n_pages)
+                return
+        finally:
+            pdf.close()
+
+    # Worker processes open the document by path, so it is written to disk
+    # once rather than pickled to every worker
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as spool:
+        if isinstance(source, bytes):
+            spool.write(source)
+        else:
+            source.seek(0)
+            shutil.copyfileobj(source, spool)
+        spool.flush()
+
+        chunk_size = -(-n_pages // _PDF_WORKERS)  # ceiling division
+        starts = list(range(0, n_pages, chunk_size))
+        ends = [min(start + chunk_size, n_pages) for start in starts]
+
+        for chunk in _get_pdf_pool().map(
+            _extract_page_range, [spool.name] * len(starts), starts, ends
+        ):
+            yield from chunk
+
+
+def _iter_pages_pdfplumber(source: Union[bytes, BinaryIO]) -> Iterator[str]:
+    """Fallback extractor: yield page text via pdfplumber (pdfminer.six)."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    else:
+        source.seek(0)
+    with pdfplumber.open(source) as pdf:
         for page in pdf.pages:
-            text = page.extract_text() or ""
-            pages.append(text)
-    return pages
+            yield page.extract_text() or ""
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Process-pool worker: open the PDF independently and read [start, end)."""
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return _read_pages(pdf, start, end)
+    finally:
+        pdf.close()
+
+
+def _read_pages(pdf: "pdfium.PdfDocument", start: int, end: int) -> List[str]:
+    """Extract text for pages [start, end) as a list (picklable for workers)."""
+    return list(_iter_page_text(pdf, start, end))
+
+
+def _iter_page_text(pdf: "pdfium.PdfDocument", start: int, end: int) -> Iterator[str]:
+    """
+    Yield text for pages [start, end) with pypdfium2 (native PDFium).
+    PDFium emits CRLF line endings; these are normalised to LF so the
+    line-anchored PHI patterns behave as they did with pdfplumber.
+    """
+    for i in range(start, end):
+        page = pdf[i]
+        textpage = page.get_textpage()
+        text = textpage.get_text_range() or ""
+        textpage.close()
+        page.close()
+        yield text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Create the page-extraction process pool on first use."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn, not fork: the caller runs inside the server's threadpool
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=_PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_pool
 
 
 def _strip_nhs_footer_lines(page_text: str) -> str:
@@ -1,41 +1,68 @@
 import os
-import json
 import re
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
-from openai import OpenAI
+import httpx
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from app.schemas import ExtractionResult
+from app.services import cache
 from app.services.medication_cards import MEDICATION_CARDS_PROMPT_SECTION
 from app.services.investigation_cards import INVESTIGATION_CARDS_PROMPT_SECTION
 
-# Create OpenAI client (uses OPENAI_API_KEY from environment)
-client = OpenAI()
+# Create OpenAI client (uses OPENAI_API_KEY from environment).
+# One pooled HTTP/2 connection pool is shared by every in-flight extraction,
+# so requests reuse warm TLS connections and multiplex over a single socket.
+# The async client awaits the model round-trip on the event loop instead of
+# parking a threadpool worker for its full duration.
+client = AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+)
 
 
-def deidentify_text(text: str) -> str:
-    """
-    Very simple PHI scrubbing. You can extend with better regex later.
-    This is run BEFORE the text is sent to OpenAI.
-    """
-    # Name line
-    text = re.sub(r"(?i)name:\s*.*", "Name: <<PATIENT_NAME>>", text)
+EXTRACTOR_MODEL = "gpt-4o"
 
-    # DOB
-    text = re.sub(r"(?i)dob:\s*.*", "DOB: <<DOB>>", text)
 
-    # NHS number (rough match)
-    text = re.sub(r"\b\d{3}\s?\d{3}\s?\d{4}\b", "<<NHS_NUMBER>>", text)
+async def close_client() -> None:
+    """Release pooled connections; called at app shutdown."""
+    await client.close()
 
-    # Postcodes
-    text = re.sub(r"\b[A-Z]{1,2}\d[A-Z0-9]?\s*\d[A-Z]{2}\b", "<<POSTCODE>>", text)
 
-    # Phone numbers
-    text = re.sub(r"\b0\d{9,10}\b", "<<PHONE_NUMBER>>", text)
+# PHI patterns fused into one alternation so the text is scanned once.
+# Branch order matters: where two patterns match at the same position the
+# earlier one wins, matching the order the substitutions used to run in.
+# The DOB branch also swallows a later "name:" on its line (whose \s* may
+# run onto the next line), as the name pass used to rewrite it first.
+_PHI_RE = re.compile(
+    r"(?P<name>(?i:name:)\s*.*)"                           # Name line
+    r"|(?P<dob>(?i:dob:)\s*(?:.*?(?i:name:)\s*)?.*)"       # DOB
+    r"|(?P<nhs>\b\d{3}\s?\d{3}\s?\d{4}\b)"                # NHS number (rough match)
+    r"|(?P<postcode>\b[A-Z]{1,2}\d[A-Z0-9]?\s*\d[A-Z]{2}\b)"  # Postcodes
+    r"|(?P<phone>\b0\d{9,10}\b)"                           # Phone numbers
+)
 
-    return text
+_PHI_SUBS = {
+    "name": "Name: <<PATIENT_NAME>>",
+    "dob": "DOB: <<DOB>>",
+    "nhs": "<<NHS_NUMBER>>",
+    "postcode": "<<POSTCODE>>",
+    "phone": "<<PHONE_NUMBER>>",
+}
+
+
+def deidentify_text(text: str) -> str:
+    """
+    Very simple PHI scrubbing. You can extend with better regex later.
+    This is run BEFORE the text is sent to OpenAI.
+    """
+    return _PHI_RE.sub(lambda m: _PHI_SUBS[m.lastgroup], text)
 
 
 EXTRACTOR_SYSTEM_PROMPT = f"""
@@ -257,14 +284,46 @@ SELF-CHECK — before finalising your JSON output, verify all 10 of the followin
 """
 
 
-def extract_structured(raw_text: str) -> ExtractionResult:
+async def extract_structured(raw_text: str) -> ExtractionResult:
     """
     Main extractor entrypoint:
     - de-identifies text
     - calls OpenAI
     - parses JSON into ExtractionResult
+
+    Only the model round-trip is awaited on the event loop. De-identification,
+    the SQLite-backed completion cache and JSON parsing / validation are
+    blocking, so they run in the threadpool.
     """
 
+    deid, user_prompt, cache_key, content = await run_in_threadpool(
+        _prepare_request, raw_text
+    )
+    from_cache = content is not None
+
+    if not from_cache:
+        # Use the new OpenAI client API
+        response = await client.chat.completions.create(
+            model=EXTRACTOR_MODEL,
+            messages=[
+                {"role": "system", "content": EXTRACTOR_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.3,
+            # JSON mode: the API guarantees a bare JSON object, never
+            # wrapped in ```json fences
+            response_format={"type": "json_object"},
+            seed=0,
+        )
+        content = response.choices[0].message.content
+
+    return await run_in_threadpool(
+        _parse_extraction, content, deid, cache_key, from_cache
+    )
+
+
+def _prepare_request(raw_text: str) -> Tuple[str, str, str, Optional[str]]:
+    """De-identify the letter, build the user prompt and look up the cache."""
     deid = deidentify_text(raw_text)
 
     user_prompt = f"""
@@ -276,31 +335,27 @@ def extract_structured(raw_text: str) -> ExtractionResult:
     Do not include any extra text before or after the JSON.
     """
 
-    # Use the new OpenAI client API
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": EXTRACTOR_SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.3,
-    )
+    # With the disk cache enabled, identical letters reuse the stored
+    # completion (see app/services/cache.py)
+    cache_key = cache.completion_key(EXTRACTOR_MODEL, EXTRACTOR_SYSTEM_PROMPT, user_prompt)
+    return deid, user_prompt, cache_key, cache.get_completion(cache_key)
 
-    content = response.choices[0].message.content.strip()
-
-    # Strip ```json ... ``` wrappers if present
-    if content.startswith("```"):
-        content = content.strip("`")
-        if content.lower().startswith("json"):
-            content = content[4:].strip()
 
+def _parse_extraction(
+    content: str, deid: str, cache_key: str, from_cache: bool
+) -> ExtractionResult:
+    """Parse and normalise the model's JSON into an ExtractionResult."""
     try:
-        data: Dict[str, Any] = json.loads(content)
-    except json.JSONDecodeError as e:
+        data: Dict[str, Any] = orjson.loads(content)
+    except orjson.JSONDecodeError as e:
         raise ValueError(
             f"Failed to parse extractor JSON: {e}\nRaw content: {content}"
         )
 
+    # Only completions that parse are worth replaying
+    if not from_cache:
+        cache.set_completion(cache_key, content)
+
     for key in [
         "diagnoses",
         "procedures",
@@ -354,6 +409,5 @@ def extract_structured(raw_text: str) -> ExtractionResult:
     data.setdefault("staged_procedure", False)
     data.setdefault("help_seeking", {"call_999": [], "contact_gp": [], "contact_team": None})
 
-    result = ExtractionResult(**data)
-    result.raw_text = deid
-    return result
\ No newline at end of file
+    data["raw_text"] = deid
+    return ExtractionResult(**data)
\ No newline at end of file
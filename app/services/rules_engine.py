@@ -1,36 +1,38 @@
 import re
 from datetime import date
-from typing import List
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Pattern, Set
 
-from app.schemas import ExtractionResult, RuleAlert, MedicationChange
+from app.schemas import ExtractionResult, RuleAlert
 
 
-# Helper drug groups
-ANTICOAGULANTS = [
+# Helper drug groups — matched against the word tokens of a medication name,
+# so combination products ("sacubitril/valsartan") hit each component
+ANTICOAGULANTS = frozenset({
     "apixaban", "rivaroxaban", "edoxaban", "dabigatran", "warfarin",
-]
+})
 
-DAPT_AGENTS = [
+DAPT_AGENTS = frozenset({
     "clopidogrel", "ticagrelor", "prasugrel",
-]
+})
 
-ANTIPLATELETS = [
+ANTIPLATELETS = frozenset({
     "clopidogrel", "ticagrelor", "prasugrel", "aspirin",
-]
+})
 
-ACE_ARB_ARNI = [
+ACE_ARB_ARNI = frozenset({
     "ramipril", "lisinopril", "perindopril", "enalapril",
     "losartan", "candesartan", "valsartan",
     "sacubitril",  # sacubitril/valsartan (Entresto)
-]
+})
 
-BETA_BLOCKERS = [
+BETA_BLOCKERS = frozenset({
     "bisoprolol", "carvedilol", "metoprolol", "nebivolol",
-]
+})
 
-STATINS = [
+STATINS = frozenset({
     "atorvastatin", "rosuvastatin", "simvastatin", "pravastatin",
-]
+})
 
 ECHO_SEVERE_AS_TERMS = ["severe aortic stenosis", "severe as", "critical as"]
 ECHO_MODERATE_SEVERE_MR_TERMS = ["moderate mr", "severe mr", "moderate mitral regurgitation", "severe mitral regurgitation"]
@@ -38,178 +40,463 @@ PCI_TERMS = ["pci", "angioplasty", "percutaneous coronary intervention", "stent"
 ECHO_TERMS = ["echocardiogram", "echo", "tte", "toe", "transthoracic"]
 ANGIO_TERMS = ["coronary angiogram", "angiography", "coronary angiography"]
 
+AF_TERMS = ["atrial fibrillation", "af"]
+MI_TERMS = ["mi", "myocardial infarction"]
+ACS_TERMS = ["acs"]
+HF_TERMS = ["heart failure", "hf"]
+OTHER_ACUTE_TERMS = ["pneumonia", "pulmonary embolism", "stroke", "tia"]
+ANGIOPLASTY_TERMS = ["pci", "angioplasty"]
+AMIODARONE_MONITORING_TERMS = ["thyroid", "liver", "tfts", "lft", "chest", "cxr", "amiodarone", "monitor"]
+
+
+def _term_groups_pattern(groups: Dict[str, List[str]]) -> Pattern[str]:
+    """
+    Compile term groups into one pattern whose matches name the group found,
+    with the same plain-substring semantics as `term in text`. Each match is
+    a zero-width lookahead, so no term consumes text another term overlaps.
+    A term must not be a prefix of a term in another group, or only the
+    first group would be reported where both start.
+    """
+    return re.compile("(?=" + "|".join(
+        f"(?P<{name}>" + "|".join(re.escape(t) for t in terms) + ")"
+        for name, terms in groups.items()
+    ) + ")")
+
+
+def _groups_found(pattern: Pattern[str], text: str) -> Set[str]:
+    """names of the term groups that occur anywhere in text"""
+    return {m.lastgroup for m in pattern.finditer(text)}
+
+
+_DIAGNOSIS_RE = _term_groups_pattern({
+    "af": AF_TERMS,                     # Rule 1
+    "mi": MI_TERMS,                     # Rules 2, 3, 5
+    "acs": ACS_TERMS,                   # Rules 2, 3
+    "hf": HF_TERMS,                     # Rules 4, 5
+    "acute": OTHER_ACUTE_TERMS,         # Rule 5
+})
+
+@lru_cache(maxsize=4096)
+def _diagnosis_groups(diagnosis: str) -> FrozenSet[str]:
+    """term groups in one diagnosis entry; memoised, as entries recur"""
+    return frozenset(_groups_found(_DIAGNOSIS_RE, diagnosis.lower()))
+
+
+_PROCEDURE_RE = _term_groups_pattern({
+    "pci": ANGIOPLASTY_TERMS,                                           # Rules 6, 12, 13, 17
+    "pci_other": [t for t in PCI_TERMS if t not in ANGIOPLASTY_TERMS],  # Rules 12, 13, 17
+    "angio": ANGIO_TERMS,                                               # Rule 19
+    "femoral": ["femoral"],                                             # Rule 19
+})
+
+@lru_cache(maxsize=4096)
+def _procedure_groups(procedure: str) -> FrozenSet[str]:
+    """term groups in one procedure entry; memoised, as entries recur"""
+    return frozenset(_groups_found(_PROCEDURE_RE, procedure.lower()))
+
+_FOLLOW_UP_RE = _term_groups_pattern({
+    "cardio": ["cardio", "cardiac", "pci", "post-pci", "heart", "coronary", "angio"],  # Rule 2
+    "dapt_or_wound": ["wound", "stent", "site", "dapt", "dual antiplatelet"],          # Rule 6
+    "monitoring": AMIODARONE_MONITORING_TERMS,                                       # Rule 11
+})
+
+
+def _any_term_pattern(terms: List[str]) -> Pattern[str]:
+    """one pattern that searches like `any(term in text for term in terms)`"""
+    return re.compile("|".join(re.escape(t) for t in terms))
+
+
+# Keyword patterns, each compiled once from the phrase list its rule used to
+# probe term by term
+_AMIODARONE_MONITORING_RE = _any_term_pattern(AMIODARONE_MONITORING_TERMS)  # Rule 11: pending tests
+_DRIVING_ADVICE_RE = _any_term_pattern(       # Rule 12: patient instructions
+    ["drive", "driving", "dvla", "licence", "license"])
+_NOT_A_CURE_RE = _any_term_pattern(           # Rule 13: narrative
+    ["not a cure", "patch, not a cure", "new blockages", "lifestyle changes"])
+_ESSENTIAL_MEDS_RE = _any_term_pattern(       # Rule 14: narrative
+    ["essential", "life-support", "protect your heart muscle", "every day", "do not stop"])
+_SEVERE_AS_RE = _any_term_pattern(ECHO_SEVERE_AS_TERMS)  # Rule 15: imaging
+_VALVE_SPECIALIST_RE = _any_term_pattern(     # Rule 15: narrative
+    ["specialist", "valve replacement", "valve repair", "discuss", "tavi", "avr"])
+_MODERATE_SEVERE_MR_RE = _any_term_pattern(ECHO_MODERATE_SEVERE_MR_TERMS)  # Rule 16: imaging
+_MR_FOLLOW_UP_RE = _any_term_pattern(         # Rule 16: narrative
+    ["specialist", "review", "monitor", "repair", "surgery", "intervention", "extra work"])
+_REHAB_IN_LETTER_RE = _any_term_pattern(      # Rule 17: raw letter text
+    ["cardiac rehab", "cardiac rehabilitation", "rehab referral"])
+_REHAB_IN_OUTPUT_RE = _any_term_pattern(      # Rule 17: narrative
+    ["rehab", "rehabilitation", "maintenance programme"])
+_ECHO_RE = _any_term_pattern(ECHO_TERMS)      # Rule 18: imaging
+_GROIN_SITE_ADVICE_RE = _any_term_pattern(    # Rule 19: patient instructions
+    ["groin", "femoral", "pseudoaneurysm", "lump", "tender"])
+
+
+# Drug class bits: each medication is classified once into an int mask
+_DRUG_AC = 1 << 0
+_DRUG_DAPT = 1 << 1
+_DRUG_ANTIPLATELET = 1 << 2
+_DRUG_ACE_ARB_ARNI = 1 << 3
+_DRUG_BB = 1 << 4
+_DRUG_STATIN = 1 << 5
+_DRUG_AMIODARONE = 1 << 6
+
+_HF_CORE_THERAPY = _DRUG_ACE_ARB_ARNI | _DRUG_BB  # Rule 4 needs both
+
+_DRUG_CLASSES = (
+    (_DRUG_AC, ANTICOAGULANTS),
+    (_DRUG_DAPT, DAPT_AGENTS),
+    (_DRUG_ANTIPLATELET, ANTIPLATELETS),
+    (_DRUG_ACE_ARB_ARNI, ACE_ARB_ARNI),
+    (_DRUG_BB, BETA_BLOCKERS),
+    (_DRUG_STATIN, STATINS),
+    (_DRUG_AMIODARONE, frozenset({"amiodarone"})),
+)
+
+# drug name -> OR of the class bits of every group it belongs to
+_DRUG_CLASS_BY_TOKEN: Dict[str, int] = {
+    drug: sum(bit for bit, group in _DRUG_CLASSES if drug in group)
+    for _, group in _DRUG_CLASSES
+    for drug in group
+}
+
+_NAME_TOKEN_RE = re.compile(r"[a-z]+")
+
+
+@lru_cache(maxsize=4096)
+def _drug_class_mask(name: str) -> int:
+    """
+    classify a medication name by its lowercase alphabetic words.
+    Pure (the MedicationChange is left as extracted) and memoised, since
+    the same drug names recur across letters.
+    """
+    mask = 0
+    for token in _NAME_TOKEN_RE.findall(name.lower()):
+        mask |= _DRUG_CLASS_BY_TOKEN.get(token, 0)
+    return mask
+
+
+# Alerts whose wording never varies are built once at import and shared
+# across calls (RuleAlert is frozen); only alerts that quote values from
+# the letter are constructed per call.
+_ALERT_AF_AC_STOPPED = RuleAlert(
+    code="AF_AC_STOPPED",
+    severity="critical",
+    message=(
+        "Anticoagulant appears to have been stopped in a patient with "
+        "atrial fibrillation. This may increase stroke risk and should "
+        "be reviewed urgently."
+    ),
+    suggested_question=(
+        "My blood thinner seems to have been stopped even though I have "
+        "atrial fibrillation. Is this safe?"
+    ),
+)
+
+_ALERT_MI_NO_CARDIO_FU = RuleAlert(
+    code="MI_NO_CARDIO_FU",
+    severity="warning",
+    message=(
+        "A heart attack / ACS is documented but no cardiology clinic "
+        "follow-up was found."
+    ),
+    suggested_question="Should I have a follow-up appointment with a cardiologist?",
+)
+
+_ALERT_MI_NO_STATIN = RuleAlert(
+    code="MI_NO_STATIN",
+    severity="warning",
+    message=(
+        "A heart attack / ACS is documented but no statin medication "
+        "was identified."
+    ),
+    suggested_question="Should I be on a statin to reduce my risk after a heart attack?",
+)
+
+_ALERT_HF_INCOMPLETE_THERAPY = RuleAlert(
+    code="HF_INCOMPLETE_THERAPY",
+    severity="warning",
+    message=(
+        "Heart failure is documented but guideline-standard medications "
+        "(ACEi/ARB/ARNI and beta-blocker) are not clearly present."
+    ),
+    suggested_question="Are my heart failure medications complete?",
+)
+
+_ALERT_NO_REDFLAG_ADVICE = RuleAlert(
+    code="NO_REDFLAG_ADVICE",
+    severity="info",
+    message=(
+        "An acute illness is documented but no red-flag safety advice "
+        "was identified."
+    ),
+    suggested_question="What symptoms mean I should seek urgent help?",
+)
+
+_ALERT_PCI_NO_DAPT_PLAN = RuleAlert(
+    code="PCI_NO_DAPT_PLAN",
+    severity="info",
+    message=(
+        "PCI / angioplasty is documented but no plan for DAPT duration "
+        "or wound review was found."
+    ),
+    suggested_question="How long should I stay on both blood thinners after my stent?",
+)
+
+_ALERT_DUAL_ANTITHROMBOTIC = RuleAlert(
+    code="DUAL_ANTITHROMBOTIC",
+    severity="critical",
+    message=(
+        "Both a blood-thinning tablet (anticoagulant) and a DAPT agent "
+        "(e.g. clopidogrel or ticagrelor) appear to be prescribed together. "
+        "This combination significantly increases bleeding risk and requires "
+        "close monitoring."
+    ),
+    suggested_question=(
+        "I am on both a blood thinner and a clopidogrel-type medicine — "
+        "who should I contact if I notice unusual bruising or bleeding?"
+    ),
+)
+
+_ALERT_TRIPLE_THERAPY = RuleAlert(
+    code="TRIPLE_THERAPY",
+    severity="critical",
+    message=(
+        "You appear to be on triple therapy: a blood-thinning tablet "
+        "(anticoagulant) plus two antiplatelet medicines. This combination "
+        "carries a high risk of serious bleeding and requires close monitoring "
+        "by your cardiac team."
+    ),
+    suggested_question=(
+        "I am on a blood thinner and two antiplatelet medicines at the same "
+        "time — how long should I stay on all three, and what bleeding signs "
+        "should I watch for?"
+    ),
+)
+
+_ALERT_AMIODARONE_NO_MONITORING = RuleAlert(
+    code="AMIODARONE_NO_MONITORING",
+    severity="warning",
+    message=(
+        "Amiodarone is prescribed but no monitoring plan (thyroid function, "
+        "liver tests, or chest X-ray) was identified in the follow-up. "
+        "Long-term amiodarone requires regular blood and imaging checks."
+    ),
+    suggested_question=(
+        "I have been started on amiodarone — what monitoring blood tests "
+        "and checks do I need, and how often?"
+    ),
+)
+
+_ALERT_R12_PCI_NO_DRIVING_ADVICE = RuleAlert(
+    code="R12_PCI_NO_DRIVING_ADVICE",
+    severity="critical",
+    message=(
+        "PCI documented but no driving instructions found. "
+        "Group 1: 1 week elective / 4 weeks post-MI. "
+        "Group 2: DVLA notification required."
+    ),
+    suggested_question=(
+        "What are the driving restrictions after my heart procedure, "
+        "and do I need to contact the DVLA?"
+    ),
+)
+
+_ALERT_R13_PCI_NO_CURE_STATEMENT = RuleAlert(
+    code="R13_PCI_NO_CURE_STATEMENT",
+    severity="critical",
+    message=(
+        "PCI documented but 'stent is not a cure' statement absent. "
+        "Mandatory closing statement for all PCI outputs."
+    ),
+    suggested_question=(
+        "Does having a stent mean my heart disease is cured, "
+        "or do I still need to take my medications?"
+    ),
+)
+
+_ALERT_R15_SEVERE_AS_NO_SPECIALIST = RuleAlert(
+    code="R15_SEVERE_AS_NO_SPECIALIST",
+    severity="critical",
+    message=(
+        "Severe aortic stenosis documented but no specialist review "
+        "or valve intervention discussion present."
+    ),
+    suggested_question=(
+        "My echo showed a severely narrowed heart valve — what does "
+        "this mean and will I need an operation?"
+    ),
+)
+
+_ALERT_R16_SIGNIFICANT_MR_NO_FU = RuleAlert(
+    code="R16_SIGNIFICANT_MR_NO_FU",
+    severity="warning",
+    message=(
+        "Moderate or severe mitral regurgitation documented but no "
+        "specialist review or monitoring message present."
+    ),
+    suggested_question=(
+        "My echo showed a leaky heart valve — what does this mean "
+        "for my long-term care?"
+    ),
+)
+
+_ALERT_R17_PCI_REHAB_NOT_MENTIONED = RuleAlert(
+    code="R17_PCI_REHAB_NOT_MENTIONED",
+    severity="warning",
+    message=(
+        "Cardiac rehabilitation referral in discharge letter "
+        "but not included in CardioCoach output."
+    ),
+    suggested_question=(
+        "I was referred to cardiac rehabilitation — what is it "
+        "and should I attend?"
+    ),
+)
+
+_ALERT_R18_ECHO_NO_EF = RuleAlert(
+    code="R18_ECHO_NO_EF",
+    severity="info",
+    message=(
+        "Echocardiogram documented but ejection fraction not extracted. "
+        "Check source letter — EF may be present and was missed."
+    ),
+    suggested_question="What did my heart scan show about how well my heart is pumping?",
+)
+
+_ALERT_R19_FEMORAL_NO_SITE_ADVICE = RuleAlert(
+    code="R19_FEMORAL_NO_SITE_ADVICE",
+    severity="warning",
+    message=(
+        "Femoral access documented but no groin site instructions "
+        "or pseudoaneurysm warning present."
+    ),
+    suggested_question=(
+        "What should I watch for at the site where the procedure "
+        "was performed in my groin?"
+    ),
+)
+
+
+# Follow-up dates, tried in order (Rule 7)
+_DATE_PATTERNS: List[Pattern[str]] = [
+    re.compile(r"\b(\d{1,2})[\/\-](\d{1,2})[\/\-](\d{4})\b"),   # DD/MM/YYYY or DD-MM-YYYY
+    re.compile(r"\b(\d{4})[\/\-](\d{1,2})[\/\-](\d{1,2})\b"),   # YYYY-MM-DD
+]
+
 
-def _lower_meds(meds: List[MedicationChange]) -> List[MedicationChange]:
-    """normalize medication names for safer comparison"""
-    for m in meds:
-        m.name = m.name.lower()
-    return meds
+def _has_rule_inputs(extraction: ExtractionResult) -> bool:
+    """True if any field that can trigger a rule is populated"""
+    return bool(
+        extraction.diagnoses
+        or extraction.procedures
+        or extraction.medication_changes
+        or extraction.follow_up
+        or extraction.imaging_results
+        or extraction.ef_percent is not None
+    )
 
 
 def run_rules(extraction: ExtractionResult) -> List[RuleAlert]:
+    return _run_rules(extraction, date.today())
+
+
+def run_rules_batch(extractions: List[ExtractionResult]) -> List[List[RuleAlert]]:
+    """Run the rules over many extractions, reading today's date once"""
+    today = date.today()
+    return [_run_rules(extraction, today) for extraction in extractions]
+
+
+def _run_rules(extraction: ExtractionResult, today: date) -> List[RuleAlert]:
     alerts: List[RuleAlert] = []
 
-    diagnoses_text = " ".join(extraction.diagnoses).lower()
-    procedures_text = " ".join(extraction.procedures).lower()
-    meds = _lower_meds(extraction.medication_changes)
+    # Blank or unreadable letters extract nothing: no rule can fire
+    if not _has_rule_inputs(extraction):
+        return alerts
+
+    diagnoses_found: Set[str] = set()
+    for diagnosis in extraction.diagnoses:
+        diagnoses_found |= _diagnosis_groups(diagnosis)
+    procedures_found: Set[str] = set()
+    for procedure in extraction.procedures:
+        procedures_found |= _procedure_groups(procedure)
+    has_pci = "pci" in procedures_found or "pci_other" in procedures_found
+    # All follow-up types in one lowercase pass; no keyword spans a newline,
+    # so joining cannot create a match across two entries
+    follow_up_found = _groups_found(
+        _FOLLOW_UP_RE, "\n".join(fu.type for fu in extraction.follow_up).lower()
+    )
+    # One pass over medications, folding each drug-class mask into the
+    # aggregates the medication rules test with integer ANDs
+    all_classes = stopped_classes = active_classes = started_classes = 0
+    active_count = active_antiplatelet_count = 0
+    for m in extraction.medication_changes:
+        cls = _drug_class_mask(m.name)
+        all_classes |= cls
+        if m.action == "stop":
+            stopped_classes |= cls
+            continue
+        active_classes |= cls
+        active_count += 1
+        if cls & _DRUG_ANTIPLATELET:
+            active_antiplatelet_count += 1
+        if m.action in ("start", "continue"):
+            started_classes |= cls
+
+    # Several rules probe the same free-text fields: lowercase each once
+    narrative = (extraction.narrative_summary or "").lower()
+    instructions = (extraction.patient_instructions or "").lower()
 
     # ------------------------------------------
     # Rule 1 — AF + anticoagulant stopped (critical)
     # ------------------------------------------
-    if "atrial fibrillation" in diagnoses_text or "af" in diagnoses_text:
-        stopped_thinner = [
-            m for m in meds
-            if m.action == "stop" and any(drug in m.name for drug in ANTICOAGULANTS)
-        ]
-        if stopped_thinner:
-            alerts.append(
-                RuleAlert(
-                    code="AF_AC_STOPPED",
-                    severity="critical",
-                    message=(
-                        "Anticoagulant appears to have been stopped in a patient with "
-                        "atrial fibrillation. This may increase stroke risk and should "
-                        "be reviewed urgently."
-                    ),
-                    suggested_question=(
-                        "My blood thinner seems to have been stopped even though I have "
-                        "atrial fibrillation. Is this safe?"
-                    ),
-                )
-            )
+    if "af" in diagnoses_found:
+        if stopped_classes & _DRUG_AC:
+            alerts.append(_ALERT_AF_AC_STOPPED)
 
     # ------------------------------------------
     # Rule 2 — MI/ACS + no cardiology follow-up (warning)
     # ------------------------------------------
-    if any(term in diagnoses_text for term in ["mi", "myocardial infarction", "acs"]):
-        cardio_keywords = ["cardio", "cardiac", "pci", "post-pci", "heart", "coronary", "angio"]
-        has_fu = any(
-            any(kw in fu.type.lower() for kw in cardio_keywords)
-            for fu in extraction.follow_up
-        )
-
-        if not has_fu:
-            alerts.append(
-                RuleAlert(
-                    code="MI_NO_CARDIO_FU",
-                    severity="warning",
-                    message=(
-                        "A heart attack / ACS is documented but no cardiology clinic "
-                        "follow-up was found."
-                    ),
-                    suggested_question=(
-                        "Should I have a follow-up appointment with a cardiologist?"
-                    ),
-                )
-            )
+    if "mi" in diagnoses_found or "acs" in diagnoses_found:
+        if "cardio" not in follow_up_found:
+            alerts.append(_ALERT_MI_NO_CARDIO_FU)
 
         # ------------------------------------------
         # Rule 3 — MI + no statin
         # ------------------------------------------
-        has_statin = any(
-            any(statin in m.name for statin in STATINS)
-            for m in meds
-        )
-        if not has_statin:
-            alerts.append(
-                RuleAlert(
-                    code="MI_NO_STATIN",
-                    severity="warning",
-                    message=(
-                        "A heart attack / ACS is documented but no statin medication "
-                        "was identified."
-                    ),
-                    suggested_question=(
-                        "Should I be on a statin to reduce my risk after a heart attack?"
-                    ),
-                )
-            )
+        if not all_classes & _DRUG_STATIN:
+            alerts.append(_ALERT_MI_NO_STATIN)
 
     # ------------------------------------------
     # Rule 4 — HF + incomplete therapy (ACE/ARB/ARNI + BB)
     # ------------------------------------------
-    if "heart failure" in diagnoses_text or "hf" in diagnoses_text:
-        has_ace_arb_arni = any(
-            any(drug in m.name for drug in ACE_ARB_ARNI)
-            for m in meds
-        )
-        has_beta_blocker = any(
-            any(bb in m.name for bb in BETA_BLOCKERS)
-            for m in meds
-        )
-
-        if not (has_ace_arb_arni and has_beta_blocker):
-            alerts.append(
-                RuleAlert(
-                    code="HF_INCOMPLETE_THERAPY",
-                    severity="warning",
-                    message=(
-                        "Heart failure is documented but guideline-standard medications "
-                        "(ACEi/ARB/ARNI and beta-blocker) are not clearly present."
-                    ),
-                    suggested_question=(
-                        "Are my heart failure medications complete?"
-                    ),
-                )
-            )
+    if "hf" in diagnoses_found:
+        if (all_classes & _HF_CORE_THERAPY) != _HF_CORE_THERAPY:
+            alerts.append(_ALERT_HF_INCOMPLETE_THERAPY)
 
     # ------------------------------------------
     # Rule 5 — Acute diagnosis but no red-flag advice (info)
     # ------------------------------------------
-    acute_terms = ["mi", "myocardial infarction", "hf", "heart failure",
-                   "pneumonia", "pulmonary embolism", "stroke", "tia"]
+    has_acute = (
+        "mi" in diagnoses_found or "hf" in diagnoses_found or "acute" in diagnoses_found
+    )
 
-    if any(term in diagnoses_text for term in acute_terms) and not extraction.red_flags:
-        alerts.append(
-            RuleAlert(
-                code="NO_REDFLAG_ADVICE",
-                severity="info",
-                message=(
-                    "An acute illness is documented but no red-flag safety advice "
-                    "was identified."
-                ),
-                suggested_question="What symptoms mean I should seek urgent help?",
-            )
-        )
+    if has_acute and not extraction.red_flags:
+        alerts.append(_ALERT_NO_REDFLAG_ADVICE)
 
     # ------------------------------------------
     # Rule 6 — PCI but no DAPT/wound follow-up (info)
     # ------------------------------------------
-    if any(term in procedures_text for term in ["pci", "angioplasty"]):
-        has_dapt_or_wound_fu = any(
-            any(keyword in fu.type.lower() for keyword in
-                ["wound", "stent", "site", "dapt", "dual antiplatelet"])
-            for fu in extraction.follow_up
-        )
-
-        if not has_dapt_or_wound_fu:
-            alerts.append(
-                RuleAlert(
-                    code="PCI_NO_DAPT_PLAN",
-                    severity="info",
-                    message=(
-                        "PCI / angioplasty is documented but no plan for DAPT duration "
-                        "or wound review was found."
-                    ),
-                    suggested_question=(
-                        "How long should I stay on both blood thinners after my stent?"
-                    ),
-                )
-            )
+    if "pci" in procedures_found:
+        if "dapt_or_wound" not in follow_up_found:
+            alerts.append(_ALERT_PCI_NO_DAPT_PLAN)
 
     # ------------------------------------------
     # Rule 7 — Stale follow-up date (warning)
     # ------------------------------------------
-    today = date.today()
-    date_patterns = [
-        r"\b(\d{1,2})[\/\-](\d{1,2})[\/\-](\d{4})\b",   # DD/MM/YYYY or DD-MM-YYYY
-        r"\b(\d{4})[\/\-](\d{1,2})[\/\-](\d{1,2})\b",   # YYYY-MM-DD
-    ]
     for fu in extraction.follow_up:
         when_str = fu.when or ""
         parsed = None
-        for pat in date_patterns:
-            m = re.search(pat, when_str)
+        for pat in _DATE_PATTERNS:
+            m = pat.search(when_str)
             if m:
                 try:
                     g = m.groups()
@@ -240,62 +527,20 @@ def run_rules(extraction: ExtractionResult) -> List[RuleAlert]:
     # ------------------------------------------
     # Rule 8 — Dual antithrombotic (anticoagulant + DAPT agent) (critical)
     # ------------------------------------------
-    active_meds = [m for m in meds if m.action != "stop"]
-    has_anticoagulant = any(
-        any(drug in m.name for drug in ANTICOAGULANTS) for m in active_meds
-    )
-    has_dapt = any(
-        any(drug in m.name for drug in DAPT_AGENTS) for m in active_meds
-    )
-    if has_anticoagulant and has_dapt:
-        alerts.append(
-            RuleAlert(
-                code="DUAL_ANTITHROMBOTIC",
-                severity="critical",
-                message=(
-                    "Both a blood-thinning tablet (anticoagulant) and a DAPT agent "
-                    "(e.g. clopidogrel or ticagrelor) appear to be prescribed together. "
-                    "This combination significantly increases bleeding risk and requires "
-                    "close monitoring."
-                ),
-                suggested_question=(
-                    "I am on both a blood thinner and a clopidogrel-type medicine — "
-                    "who should I contact if I notice unusual bruising or bleeding?"
-                ),
-            )
-        )
+    has_anticoagulant = bool(active_classes & _DRUG_AC)
+    if has_anticoagulant and active_classes & _DRUG_DAPT:
+        alerts.append(_ALERT_DUAL_ANTITHROMBOTIC)
 
     # ------------------------------------------
     # Rule 9 — Triple therapy: anticoagulant + 2 antiplatelets (critical)
     # Defence-in-depth: catches cases where Layer 1 prompt did not flag this
     # ------------------------------------------
-    active_antiplatelet_count = sum(
-        1 for m in active_meds
-        if any(drug in m.name for drug in ANTIPLATELETS)
-    )
     if has_anticoagulant and active_antiplatelet_count >= 2:
-        alerts.append(
-            RuleAlert(
-                code="TRIPLE_THERAPY",
-                severity="critical",
-                message=(
-                    "You appear to be on triple therapy: a blood-thinning tablet "
-                    "(anticoagulant) plus two antiplatelet medicines. This combination "
-                    "carries a high risk of serious bleeding and requires close monitoring "
-                    "by your cardiac team."
-                ),
-                suggested_question=(
-                    "I am on a blood thinner and two antiplatelet medicines at the same "
-                    "time — how long should I stay on all three, and what bleeding signs "
-                    "should I watch for?"
-                ),
-            )
-        )
+        alerts.append(_ALERT_TRIPLE_THERAPY)
 
     # ------------------------------------------
     # Rule 10 (was 9) — Polypharmacy (≥6 active medicines) (info)
     # ------------------------------------------
-    active_count = len(active_meds)
     if active_count >= 6:
         alerts.append(
             RuleAlert(
@@ -316,91 +561,35 @@ def run_rules(extraction: ExtractionResult) -> List[RuleAlert]:
     # ------------------------------------------
     # Rule 11 (was 10) — Amiodarone started without monitoring plan (warning)
     # ------------------------------------------
-    amiodarone_started = any(
-        "amiodarone" in m.name and m.action in ("start", "continue")
-        for m in active_meds
-    )
-    if amiodarone_started:
-        monitoring_kws = ["thyroid", "liver", "tfts", "lft", "chest", "cxr", "amiodarone", "monitor"]
-        has_monitoring_fu = any(
-            any(kw in fu.type.lower() for kw in monitoring_kws)
-            for fu in extraction.follow_up
-        )
+    if started_classes & _DRUG_AMIODARONE and "monitoring" not in follow_up_found:
         has_monitoring_pending = any(
-            any(kw in t.lower() for kw in monitoring_kws)
+            _AMIODARONE_MONITORING_RE.search(t.lower())
             for t in extraction.pending_tests
         )
-        if not has_monitoring_fu and not has_monitoring_pending:
-            alerts.append(
-                RuleAlert(
-                    code="AMIODARONE_NO_MONITORING",
-                    severity="warning",
-                    message=(
-                        "Amiodarone is prescribed but no monitoring plan (thyroid function, "
-                        "liver tests, or chest X-ray) was identified in the follow-up. "
-                        "Long-term amiodarone requires regular blood and imaging checks."
-                    ),
-                    suggested_question=(
-                        "I have been started on amiodarone — what monitoring blood tests "
-                        "and checks do I need, and how often?"
-                    ),
-                )
-            )
+        if not has_monitoring_pending:
+            alerts.append(_ALERT_AMIODARONE_NO_MONITORING)
 
     # ------------------------------------------
     # Rule 12 — PCI documented but no driving advice (critical)
     # ------------------------------------------
-    if any(term in procedures_text for term in PCI_TERMS):
-        driving_mentioned = any(
-            word in (extraction.patient_instructions or "").lower()
-            for word in ["drive", "driving", "dvla", "licence", "license"]
-        )
+    if has_pci:
+        driving_mentioned = _DRIVING_ADVICE_RE.search(instructions) is not None
         if not driving_mentioned:
-            alerts.append(RuleAlert(
-                code="R12_PCI_NO_DRIVING_ADVICE",
-                severity="critical",
-                message=(
-                    "PCI documented but no driving instructions found. "
-                    "Group 1: 1 week elective / 4 weeks post-MI. "
-                    "Group 2: DVLA notification required."
-                ),
-                suggested_question=(
-                    "What are the driving restrictions after my heart procedure, "
-                    "and do I need to contact the DVLA?"
-                ),
-            ))
+            alerts.append(_ALERT_R12_PCI_NO_DRIVING_ADVICE)
 
     # ------------------------------------------
     # Rule 13 — PCI documented but not-a-cure statement absent (critical)
     # ------------------------------------------
-    if any(term in procedures_text for term in PCI_TERMS):
-        cure_mentioned = any(
-            phrase in (extraction.narrative_summary or "").lower()
-            for phrase in ["not a cure", "patch, not a cure", "new blockages", "lifestyle changes"]
-        )
+    if has_pci:
+        cure_mentioned = _NOT_A_CURE_RE.search(narrative) is not None
         if not cure_mentioned:
-            alerts.append(RuleAlert(
-                code="R13_PCI_NO_CURE_STATEMENT",
-                severity="critical",
-                message=(
-                    "PCI documented but 'stent is not a cure' statement absent. "
-                    "Mandatory closing statement for all PCI outputs."
-                ),
-                suggested_question=(
-                    "Does having a stent mean my heart disease is cured, "
-                    "or do I still need to take my medications?"
-                ),
-            ))
+            alerts.append(_ALERT_R13_PCI_NO_CURE_STATEMENT)
 
     # ------------------------------------------
     # Rule 14 — Echo EF ≤35% but no medication warning (critical)
     # ------------------------------------------
     if extraction.ef_percent is not None and extraction.ef_percent <= 35:
-        medication_warning = any(
-            phrase in (extraction.narrative_summary or "").lower()
-            for phrase in ["essential", "life-support", "protect your heart muscle",
-                           "every day", "do not stop"]
-        )
+        medication_warning = _ESSENTIAL_MEDS_RE.search(narrative) is not None
         if not medication_warning:
             alerts.append(RuleAlert(
                 code="R14_LOW_EF_NO_MED_WARNING",
@@ -418,116 +607,51 @@ def run_rules(extraction: ExtractionResult) -> List[RuleAlert]:
     # ------------------------------------------
     # Rule 15 — Severe AS but no specialist review message (critical)
     # ------------------------------------------
-    imaging_text = " ".join(
-        " ".join(ir.findings) for ir in extraction.imaging_results
-    ).lower()
-    if any(term in imaging_text for term in ECHO_SEVERE_AS_TERMS):
-        specialist_mentioned = any(
-            phrase in (extraction.narrative_summary or "").lower()
-            for phrase in ["specialist", "valve replacement", "valve repair",
-                           "discuss", "tavi", "avr"]
-        )
+    imaging_findings = [
+        finding.lower()
+        for ir in extraction.imaging_results
+        for finding in ir.findings
+    ]
+    if any(_SEVERE_AS_RE.search(f) for f in imaging_findings):
+        specialist_mentioned = _VALVE_SPECIALIST_RE.search(narrative) is not None
         if not specialist_mentioned:
-            alerts.append(RuleAlert(
-                code="R15_SEVERE_AS_NO_SPECIALIST",
-                severity="critical",
-                message=(
-                    "Severe aortic stenosis documented but no specialist review "
-                    "or valve intervention discussion present."
-                ),
-                suggested_question=(
-                    "My echo showed a severely narrowed heart valve — what does "
-                    "this mean and will I need an operation?"
-                ),
-            ))
+            alerts.append(_ALERT_R15_SEVERE_AS_NO_SPECIALIST)
 
     # ------------------------------------------
     # Rule 16 — Moderate or severe MR but no follow-up message (warning)
     # ------------------------------------------
-    if any(term in imaging_text for term in ECHO_MODERATE_SEVERE_MR_TERMS):
-        fu_mentioned = any(
-            phrase in (extraction.narrative_summary or "").lower()
-            for phrase in ["specialist", "review", "monitor", "repair",
-                           "surgery", "intervention", "extra work"]
-        )
+    if any(_MODERATE_SEVERE_MR_RE.search(f) for f in imaging_findings):
+        fu_mentioned = _MR_FOLLOW_UP_RE.search(narrative) is not None
         if not fu_mentioned:
-            alerts.append(RuleAlert(
-                code="R16_SIGNIFICANT_MR_NO_FU",
-                severity="warning",
-                message=(
-                    "Moderate or severe mitral regurgitation documented but no "
-                    "specialist review or monitoring message present."
-                ),
-                suggested_question=(
-                    "My echo showed a leaky heart valve — what does this mean "
-                    "for my long-term care?"
-                ),
-            ))
+            alerts.append(_ALERT_R16_SIGNIFICANT_MR_NO_FU)
 
     # ------------------------------------------
     # Rule 17 — PCI + cardiac rehab in letter but missing from output (warning)
     # ------------------------------------------
-    if any(term in procedures_text for term in PCI_TERMS):
-        rehab_in_letter = any(
-            phrase in (extraction.raw_text or "").lower()
-            for phrase in ["cardiac rehab", "cardiac rehabilitation", "rehab referral"]
-        )
-        rehab_in_output = any(
-            phrase in (extraction.narrative_summary or "").lower()
-            for phrase in ["rehab", "rehabilitation", "maintenance programme"]
-        )
-        if rehab_in_letter and not rehab_in_output:
-            alerts.append(RuleAlert(
-                code="R17_PCI_REHAB_NOT_MENTIONED",
-                severity="warning",
-                message=(
-                    "Cardiac rehabilitation referral in discharge letter "
-                    "but not included in CardioCoach output."
-                ),
-                suggested_question=(
-                    "I was referred to cardiac rehabilitation — what is it "
-                    "and should I attend?"
-                ),
-            ))
+    if has_pci:
+        rehab_in_output = _REHAB_IN_OUTPUT_RE.search(narrative) is not None
+        # The full letter is by far the largest text: only scan it when the
+        # short narrative has not already ruled the alert out
+        if not rehab_in_output:
+            rehab_in_letter = _REHAB_IN_LETTER_RE.search(
+                (extraction.raw_text or "").lower()
+            ) is not None
+            if rehab_in_letter:
+                alerts.append(_ALERT_R17_PCI_REHAB_NOT_MENTIONED)
 
     # ------------------------------------------
     # Rule 18 — Echo documented but EF not extracted (info)
     # ------------------------------------------
-    if any(term in imaging_text for term in ECHO_TERMS):
-        if extraction.ef_percent is None:
-            alerts.append(RuleAlert(
-                code="R18_ECHO_NO_EF",
-                severity="info",
-                message=(
-                    "Echocardiogram documented but ejection fraction not extracted. "
-                    "Check source letter — EF may be present and was missed."
-                ),
-                suggested_question=(
-                    "What did my heart scan show about how well my heart is pumping?"
-                ),
-            ))
+    if extraction.ef_percent is None:
+        if any(_ECHO_RE.search(f) for f in imaging_findings):
+            alerts.append(_ALERT_R18_ECHO_NO_EF)
 
     # ------------------------------------------
     # Rule 19 — Femoral access documented but no groin site instructions (warning)
     # ------------------------------------------
-    if any(term in procedures_text for term in ANGIO_TERMS):
-        femoral = "femoral" in procedures_text
-        site_advice = any(
-            phrase in (extraction.patient_instructions or "").lower()
-            for phrase in ["groin", "femoral", "pseudoaneurysm", "lump", "tender"]
-        )
-        if femoral and not site_advice:
-            alerts.append(RuleAlert(
-                code="R19_FEMORAL_NO_SITE_ADVICE",
-                severity="warning",
-                message=(
-                    "Femoral access documented but no groin site instructions "
-                    "or pseudoaneurysm warning present."
-                ),
-                suggested_question=(
-                    "What should I watch for at the site where the procedure "
-                    "was performed in my groin?"
-                ),
-            ))
+    if "angio" in procedures_found and "femoral" in procedures_found:
+        site_advice = _GROIN_SITE_ADVICE_RE.search(instructions) is not None
+        if not site_advice:
+            alerts.append(_ALERT_R19_FEMORAL_NO_SITE_ADVICE)
 
     return alerts
\ No newline at end of file